@@ -2,7 +2,7 @@
 Dashboard CMg Real vs Programado - Coordinador Eléctrico Nacional
 =================================================================
 Requisitos:
-    pip install streamlit plotly pandas requests streamlit-autorefresh
+    pip install streamlit plotly orjson pandas numpy pyarrow requests streamlit-autorefresh
 
 Para correr:
     streamlit run cmg_dashboard.py
@@ -10,8 +10,12 @@ Para correr:
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
+import pyarrow as pa
+import pyarrow.dataset as ds
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 
@@ -49,34 +53,74 @@ def nombre_display(key_online: str) -> str:
     return f"{nombre} {tension} kV"
 
 BARRAS_DISPLAY = {nombre_display(k): k for k in BARRAS}
+# Opciones del selector, precalculadas una vez al importar
+BARRAS_DISPLAY_NAMES: tuple[str, ...] = tuple(BARRAS_DISPLAY)
 
 
 # =============================================================================
-# 2. CARGA DE DATOS DESDE CSV
+# 2. CARGA DE DATOS DESDE PARQUET
 # =============================================================================
 
 DATA_DIR = "data"
 
+# Los datasets están particionados por día (date=YYYY-MM-DD); declarar la
+# partición como date32 hace que los filtros de rango comparen fechas
+# nativas en Arrow en vez de strings
+PARTICION_DIARIA = ds.partitioning(pa.schema([("date", pa.date32())]), flavor="hive")
+
+
+def version_dataset(nombre: str) -> float:
+    """
+    mtime más reciente de los archivos de data/<nombre>/. Se pasa a los
+    loaders como parte de la clave de caché: cuando la Action reescribe el
+    dataset, la caché se invalida sin esperar al TTL.
+    """
+    ruta = os.path.join(DATA_DIR, nombre)
+    mtimes = [
+        os.path.getmtime(os.path.join(carpeta, archivo))
+        for carpeta, _, archivos in os.walk(ruta)
+        for archivo in archivos
+    ]
+    return max(mtimes, default=0.0)
+
+
+def filtro_fechas(start_date: str, end_date: str) -> list:
+    """Filtro pyarrow por la partición diaria, ambos extremos inclusive."""
+    return [
+        ("date", ">=", pd.Timestamp(start_date).date()),
+        ("date", "<=", pd.Timestamp(end_date).date()),
+    ]
+
+
 @st.cache_data(ttl=3600)  # refresca cada hora
-def cargar_cmg_online(start_date: str, end_date: str) -> pd.DataFrame:
-    """Lee cmg_online.csv y filtra por rango de fechas."""
-    ruta = os.path.join(DATA_DIR, "cmg_online.csv")
-    if not os.path.exists(ruta):
-        return pd.DataFrame()
-    df = pd.read_csv(ruta, parse_dates=["datetime"])
-    mask = (df["datetime"].dt.date >= pd.to_datetime(start_date).date()) &            (df["datetime"].dt.date <= pd.to_datetime(end_date).date())
-    return df[mask].reset_index(drop=True)
+def cargar_cmg_online(start_date: str, end_date: str, version: float) -> dict[str, pd.DataFrame]:
+    """Lee los días del rango desde data/cmg_online/ y particiona por barra."""
+    ruta = os.path.join(DATA_DIR, "cmg_online")
+    if not os.path.isdir(ruta):
+        return {}
+    df = pd.read_parquet(
+        ruta, columns=["datetime", "barra_online", "cmg_real"], engine="pyarrow",
+        partitioning=PARTICION_DIARIA, filters=filtro_fechas(start_date, end_date),
+    )
+    # float32 es precisión de sobra para USD/MWh y reduce a la mitad la memoria
+    df = df.astype({"barra_online": "category", "cmg_real": "float32"})
+    # Hora en punto precalculada aquí (camino cacheado) y no en cada rerun
+    df["hour"] = df["datetime"].values.astype("datetime64[h]")
+    return {k: g.reset_index(drop=True) for k, g in df.groupby("barra_online", sort=False, observed=True)}
 
 
 @st.cache_data(ttl=3600)
-def cargar_cmg_programado(start_date: str, end_date: str) -> pd.DataFrame:
-    """Lee cmg_programado.csv y filtra por rango de fechas."""
-    ruta = os.path.join(DATA_DIR, "cmg_programado.csv")
-    if not os.path.exists(ruta):
-        return pd.DataFrame()
-    df = pd.read_csv(ruta, parse_dates=["datetime"])
-    mask = (df["datetime"].dt.date >= pd.to_datetime(start_date).date()) &            (df["datetime"].dt.date <= pd.to_datetime(end_date).date())
-    return df[mask].reset_index(drop=True)
+def cargar_cmg_programado(start_date: str, end_date: str, version: float) -> dict[str, pd.DataFrame]:
+    """Lee los días del rango desde data/cmg_programado/ y particiona por barra."""
+    ruta = os.path.join(DATA_DIR, "cmg_programado")
+    if not os.path.isdir(ruta):
+        return {}
+    df = pd.read_parquet(
+        ruta, columns=["datetime", "barra_prog", "cmg_programado"], engine="pyarrow",
+        partitioning=PARTICION_DIARIA, filters=filtro_fechas(start_date, end_date),
+    )
+    df = df.astype({"barra_prog": "category", "cmg_programado": "float32"})
+    return {k: g.reset_index(drop=True) for k, g in df.groupby("barra_prog", sort=False, observed=True)}
 
 
 def ultima_actualizacion() -> str:
@@ -92,45 +136,167 @@ def ultima_actualizacion() -> str:
 # 3. PROCESAMIENTO
 # =============================================================================
 
-def preparar_comparacion(df_real: pd.DataFrame, df_prog: pd.DataFrame,
+def preparar_comparacion(real_dict: dict[str, pd.DataFrame],
+                          prog_dict: dict[str, pd.DataFrame],
                           barra_online: str) -> pd.DataFrame:
     """
     Para una barra dada:
-      1. Filtra el CMg Online por barra_online
-      2. Resamplea de 15 min → horario (promedio)
-      3. Filtra el CMg Programado con la clave homologada
-      4. Hace merge y calcula diferencias
+      1. Toma el CMg Online de la partición barra_online
+      2. Agrega de 15 min → horario (promedio por hora precalculada)
+      3. Toma el CMg Programado de la partición homologada
+      4. Alinea ambas series por hora y calcula diferencias
     """
-    barra_programado = BARRAS[barra_online]
-
-    # --- Online: resampleo 15 min → 1 hora ---
-    real = (
-        df_real[df_real["barra_online"] == barra_online]
-        .set_index("datetime")[["cmg_real"]]
-        .resample("1h")
-        .mean()                   # promedio de los 4 bloques de 15 min
+    real_df = real_dict[barra_online]
+    prog_df = prog_dict[BARRAS[barra_online]]
+
+    # --- Online: promedio horario de los 4 bloques de 15 min ---
+    real = real_df.groupby("hour")["cmg_real"].mean()
+
+    # --- Programado: ya es horario; solo se reindexa la columna, sin copiar el frame ---
+    prog = prog_df["cmg_programado"].set_axis(prog_df["datetime"])
+
+    # --- Alineación por índice horario (equivale al merge inner) ---
+    merged = (
+        pd.concat([real, prog], axis=1, join="inner")
+        .dropna()
+        .rename_axis("datetime")
         .reset_index()
     )
-    real["datetime"] = real["datetime"].dt.floor("1h")
+    merged["diferencia"]     = merged["cmg_real"] - merged["cmg_programado"]
+    # División protegida: NaN donde el programado es 0, sin Series intermedia
+    d = merged["diferencia"].to_numpy()
+    p = merged["cmg_programado"].to_numpy()
+    merged["diferencia_pct"] = np.divide(d, p, out=np.full_like(d, np.nan), where=p != 0) * 100
+    return merged
+
+
+# Máximo de puntos que se envían al navegador en el gráfico de 15 min
+PUNTOS_MAX_15MIN = 1500
 
-    # --- Programado: ya es horario ---
-    prog = (
-        df_prog[df_prog["barra_prog"] == barra_programado][["datetime", "cmg_programado"]]
-        .copy()
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Downsampling Largest-Triangle-Three-Buckets: devuelve los índices de los
+    n_out puntos que mejor conservan la forma visual de la serie (x, y).
+    Siempre incluye el primer y el último punto.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype("float64")
+    y = y.astype("float64")
+    # Bordes de los n_out - 2 buckets que cubren los puntos interiores [1, n-1)
+    bordes = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        # Vértice C: promedio del bucket siguiente (o el último punto)
+        sig_ini, sig_fin = (bordes[i + 1], bordes[i + 2]) if i + 2 < len(bordes) else (n - 1, n)
+        cx, cy = x[sig_ini:sig_fin].mean(), y[sig_ini:sig_fin].mean()
+        areas = np.abs(
+            (x[a] - cx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (cy - y[a])
+        )
+        a = ini + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+# =============================================================================
+# 4. FIGURAS
+# =============================================================================
+# Cacheadas por contenido del DataFrame: al volver a una barra/rango ya visto
+# no se reconstruyen las trazas.
+
+# Serialización figura → JSON con orjson (bastante más rápida que json)
+pio.json.config.default_engine = "orjson"
+
+# Config común de los gráficos en pantalla
+PLOTLY_CONFIG = {"displaylogo": False}
+
+@st.cache_data(ttl=3600)
+def fig_comparacion(df_merged: pd.DataFrame) -> go.Figure:
+    """Serie horaria Real vs Programado y barras de diferencia."""
+    fig = make_subplots(
+        rows=2, cols=1,
+        shared_xaxes=True,
+        row_heights=[0.62, 0.38],
+        subplot_titles=(
+            "CMg Real (prom. horario) vs CMg Programado PID  [USD/MWh]",
+            "Diferencia  Real − Programado  [USD/MWh]",
+        ),
+        vertical_spacing=0.08,
     )
-    prog["datetime"] = prog["datetime"].dt.floor("1h")
 
-    # --- Merge ---
-    merged = pd.merge(real, prog, on="datetime", how="inner")
-    merged["diferencia"]     = merged["cmg_real"] - merged["cmg_programado"]
-    merged["diferencia_pct"] = (
-        merged["diferencia"] / merged["cmg_programado"].replace(0, float("nan")) * 100
+    fig.add_trace(go.Scattergl(
+        x=df_merged["datetime"], y=df_merged["cmg_real"],
+        name="CMg Real", mode="lines+markers",
+        line=dict(color="#2196F3", width=2), marker=dict(size=4),
+    ), row=1, col=1)
+
+    fig.add_trace(go.Scattergl(
+        x=df_merged["datetime"], y=df_merged["cmg_programado"],
+        name="CMg Programado PID", mode="lines+markers",
+        line=dict(color="#FF9800", width=2, dash="dash"), marker=dict(size=4),
+    ), row=1, col=1)
+
+    colores = np.where(df_merged["diferencia"].to_numpy() > 0, "#e53935", "#43a047")
+    fig.add_trace(go.Bar(
+        x=df_merged["datetime"], y=df_merged["diferencia"],
+        name="Diferencia (Real − Prog.)", marker_color=colores,
+    ), row=2, col=1)
+    fig.add_hline(y=0, line_dash="dot", line_color="gray", row=2, col=1)
+
+    fig.update_layout(
+        height=600, template="plotly_white",
+        legend=dict(orientation="h", y=1.02, x=0),
+        hovermode="x unified", margin=dict(t=80),
     )
-    return merged
+    fig.update_yaxes(title_text="USD/MWh", row=1, col=1)
+    fig.update_yaxes(title_text="USD/MWh", row=2, col=1)
+    return fig
+
+
+@st.cache_data(ttl=3600)
+def fig_histograma(df_merged: pd.DataFrame) -> go.Figure:
+    """Histograma de diferencias con líneas en cero y en la media."""
+    diff_media = df_merged["diferencia"].mean()
+    fig_h = go.Figure()
+    fig_h.add_trace(go.Histogram(
+        x=df_merged["diferencia"], nbinsx=35,
+        marker_color="#5C6BC0", opacity=0.85,
+    ))
+    fig_h.add_vline(x=0, line_dash="dash", line_color="red",
+                    annotation_text="Sin diferencia", annotation_position="top right")
+    fig_h.add_vline(x=diff_media, line_dash="dot", line_color="#FF9800",
+                    annotation_text=f"Media {diff_media:+.1f}", annotation_position="top left")
+    fig_h.update_layout(
+        template="plotly_white", height=300,
+        xaxis_title="USD/MWh", yaxis_title="Frecuencia (horas)", showlegend=False,
+    )
+    return fig_h
+
+
+@st.cache_data(ttl=3600)
+def fig_online_15min(df_15: pd.DataFrame) -> go.Figure:
+    """CMg Online en resolución de 15 min (ya downsampleado si corresponde)."""
+    fig_15 = go.Figure(go.Scattergl(
+        x=df_15["datetime"], y=df_15["cmg_real"],
+        mode="lines", line=dict(color="#2196F3", width=1.5), name="CMg Online (15 min)",
+    ))
+    fig_15.update_layout(
+        template="plotly_white", height=320,
+        xaxis_title="Fecha/Hora", yaxis_title="USD/MWh",
+        hovermode="x unified", margin=dict(t=20),
+    )
+    return fig_15
 
 
 # =============================================================================
-# 4. DASHBOARD
+# 5. DASHBOARD
 # =============================================================================
 
 # Auto-refresh horario (requiere: pip install streamlit-autorefresh)
@@ -176,169 +342,133 @@ end_str   = fecha_fin.strftime("%Y-%m-%d")
 
 # ── Carga de datos ────────────────────────────────────────────────────────────
 with st.spinner("Cargando datos..."):
-    df_real = cargar_cmg_online(start_str, end_str)
-    df_prog = cargar_cmg_programado(start_str, end_str)
+    real_dict = cargar_cmg_online(start_str, end_str, version_dataset("cmg_online"))
+    prog_dict = cargar_cmg_programado(start_str, end_str, version_dataset("cmg_programado"))
 
-if df_real.empty and df_prog.empty:
+if not real_dict and not prog_dict:
     st.error("Sin datos. Verifica el rango de fechas seleccionado.")
     st.stop()
 
-# ── Sección 1: Selector de barra ──────────────────────────────────────────────
-st.markdown("---")
-
-col_sel, col_info = st.columns([1, 2])
-
-with col_sel:
-    st.subheader("🗼 Selecciona una barra")
-    nombre_sel  = st.radio("", list(BARRAS_DISPLAY.keys()), label_visibility="collapsed")
-    barra_online = BARRAS_DISPLAY[nombre_sel]
-    barra_prog   = BARRAS[barra_online]
-    st.caption(f"Online: `{barra_online}`")
-    st.caption(f"Programado: `{barra_prog}`")
-
-with col_info:
-    # Verificar disponibilidad de datos para la barra seleccionada
-    tiene_real = not df_real.empty and barra_online in df_real["barra_online"].values
-    tiene_prog = not df_prog.empty and barra_prog  in df_prog["barra_prog"].values
-
-    st.subheader("📋 Disponibilidad de datos")
-    c1, c2 = st.columns(2)
-    c1.metric(
-        "CMg Online",
-        "✅ Disponible" if tiene_real else "❌ Sin datos",
-        delta=f"{df_real[df_real['barra_online']==barra_online].shape[0]} registros (15min)" if tiene_real else None,
-    )
-    c2.metric(
-        "CMg Programado",
-        "✅ Disponible" if tiene_prog else "❌ Sin datos",
-        delta=f"{df_prog[df_prog['barra_prog']==barra_prog].shape[0]} registros (horario)" if tiene_prog else None,
-    )
+# ── Secciones dependientes de la barra ────────────────────────────────────────
+# Como fragmento, cambiar la barra solo re-ejecuta esta función; la carga de
+# datos y el sidebar no se vuelven a correr.
+@st.fragment
+def render_barra_section(real_dict: dict[str, pd.DataFrame],
+                         prog_dict: dict[str, pd.DataFrame]):
+    """Selector de barra, análisis, gráfico de 15 min y datos crudos."""
+    # ── Sección 1: Selector de barra ──────────────────────────────────────────
+    st.markdown("---")
 
-# ── Sección 2: Comparación ───────────────────────────────────────────────────
-st.markdown("---")
-st.subheader(f"📊 Análisis — {nombre_sel}")
+    col_sel, col_info = st.columns([1, 2])
+
+    with col_sel:
+        st.subheader("🗼 Selecciona una barra")
+        nombre_sel  = st.radio("", BARRAS_DISPLAY_NAMES, label_visibility="collapsed")
+        barra_online = BARRAS_DISPLAY[nombre_sel]
+        barra_prog   = BARRAS[barra_online]
+        st.caption(f"Online: `{barra_online}`")
+        st.caption(f"Programado: `{barra_prog}`")
+
+    df_real_b = real_dict.get(barra_online, pd.DataFrame())
+    df_prog_b = prog_dict.get(barra_prog, pd.DataFrame())
+
+    with col_info:
+        # Verificar disponibilidad de datos para la barra seleccionada
+        tiene_real = not df_real_b.empty
+        tiene_prog = not df_prog_b.empty
+
+        st.subheader("📋 Disponibilidad de datos")
+        c1, c2 = st.columns(2)
+        c1.metric(
+            "CMg Online",
+            "✅ Disponible" if tiene_real else "❌ Sin datos",
+            delta=f"{len(df_real_b)} registros (15min)" if tiene_real else None,
+        )
+        c2.metric(
+            "CMg Programado",
+            "✅ Disponible" if tiene_prog else "❌ Sin datos",
+            delta=f"{len(df_prog_b)} registros (horario)" if tiene_prog else None,
+        )
 
-if not tiene_real or not tiene_prog:
-    st.warning("No hay datos suficientes para comparar esta barra en el período seleccionado.")
-else:
-    df_merged = preparar_comparacion(df_real, df_prog, barra_online)
+    # ── Sección 2: Comparación ───────────────────────────────────────────────
+    st.markdown("---")
+    st.subheader(f"📊 Análisis — {nombre_sel}")
 
-    if df_merged.empty:
-        st.warning("No hay horas comunes entre el CMg Online y el Programado para esta barra.")
+    if not tiene_real or not tiene_prog:
+        st.warning("No hay datos suficientes para comparar esta barra en el período seleccionado.")
     else:
-        # KPIs
-        k1, k2, k3, k4 = st.columns(4)
-        diff_media = df_merged["diferencia"].mean()
-        mae        = df_merged["diferencia"].abs().mean()
-        max_diff   = df_merged["diferencia"].abs().max()
-        pct_mayor  = (df_merged["diferencia"] > 0).mean() * 100
-
-        k1.metric("Diferencia media",     f"{diff_media:+.1f} USD/MWh",
-                  help="Promedio de (Real − Programado)")
-        k2.metric("MAE",                   f"{mae:.1f} USD/MWh",
-                  help="Error absoluto medio por hora")
-        k3.metric("Máx. desviación abs.", f"{max_diff:.1f} USD/MWh")
-        k4.metric("% horas Real > Prog.", f"{pct_mayor:.1f}%")
-
-        # Gráfico serie temporal + diferencia
-        fig = make_subplots(
-            rows=2, cols=1,
-            shared_xaxes=True,
-            row_heights=[0.62, 0.38],
-            subplot_titles=(
-                "CMg Real (prom. horario) vs CMg Programado PID  [USD/MWh]",
-                "Diferencia  Real − Programado  [USD/MWh]",
-            ),
-            vertical_spacing=0.08,
-        )
-
-        fig.add_trace(go.Scatter(
-            x=df_merged["datetime"], y=df_merged["cmg_real"],
-            name="CMg Real", mode="lines+markers",
-            line=dict(color="#2196F3", width=2), marker=dict(size=4),
-        ), row=1, col=1)
-
-        fig.add_trace(go.Scatter(
-            x=df_merged["datetime"], y=df_merged["cmg_programado"],
-            name="CMg Programado PID", mode="lines+markers",
-            line=dict(color="#FF9800", width=2, dash="dash"), marker=dict(size=4),
-        ), row=1, col=1)
-
-        colores = ["#e53935" if v > 0 else "#43a047" for v in df_merged["diferencia"]]
-        fig.add_trace(go.Bar(
-            x=df_merged["datetime"], y=df_merged["diferencia"],
-            name="Diferencia (Real − Prog.)", marker_color=colores,
-        ), row=2, col=1)
-        fig.add_hline(y=0, line_dash="dot", line_color="gray", row=2, col=1)
-
-        fig.update_layout(
-            height=600, template="plotly_white",
-            legend=dict(orientation="h", y=1.02, x=0),
-            hovermode="x unified", margin=dict(t=80),
-        )
-        fig.update_yaxes(title_text="USD/MWh", row=1, col=1)
-        fig.update_yaxes(title_text="USD/MWh", row=2, col=1)
-        st.plotly_chart(fig, use_container_width=True)
-
-        # Histograma de diferencias
-        st.markdown("#### Distribución de diferencias (Real − Programado)")
-        fig_h = go.Figure()
-        fig_h.add_trace(go.Histogram(
-            x=df_merged["diferencia"], nbinsx=35,
-            marker_color="#5C6BC0", opacity=0.85,
-        ))
-        fig_h.add_vline(x=0, line_dash="dash", line_color="red",
-                        annotation_text="Sin diferencia", annotation_position="top right")
-        fig_h.add_vline(x=diff_media, line_dash="dot", line_color="#FF9800",
-                        annotation_text=f"Media {diff_media:+.1f}", annotation_position="top left")
-        fig_h.update_layout(
-            template="plotly_white", height=300,
-            xaxis_title="USD/MWh", yaxis_title="Frecuencia (horas)", showlegend=False,
-        )
-        st.plotly_chart(fig_h, use_container_width=True)
-
-        # Tabla de datos
-        with st.expander("📋 Ver tabla de datos"):
-            st.dataframe(
-                df_merged.rename(columns={
-                    "datetime":       "Fecha/Hora",
-                    "cmg_real":       "CMg Real (USD/MWh)",
-                    "cmg_programado": "CMg Prog. (USD/MWh)",
-                    "diferencia":     "Diferencia (USD/MWh)",
-                    "diferencia_pct": "Diferencia (%)",
-                }).round(3),
-                use_container_width=True,
-            )
-
-# ── Sección 3: CMg Online en 15 min ──────────────────────────────────────────
-st.markdown("---")
-st.subheader("🕐 CMg Online en resolución original (15 min)")
-
-if tiene_real:
-    df_15 = df_real[df_real["barra_online"] == barra_online].sort_values("datetime")
-    fig_15 = go.Figure(go.Scatter(
-        x=df_15["datetime"], y=df_15["cmg_real"],
-        mode="lines", line=dict(color="#2196F3", width=1.5), name="CMg Online (15 min)",
-    ))
-    fig_15.update_layout(
-        template="plotly_white", height=320,
-        xaxis_title="Fecha/Hora", yaxis_title="USD/MWh",
-        hovermode="x unified", margin=dict(t=20),
-    )
-    st.plotly_chart(fig_15, use_container_width=True)
-else:
-    st.info("Sin datos Online para esta barra en el período seleccionado.")
-
-# ── Raw data ──────────────────────────────────────────────────────────────────
-with st.expander("🔬 Datos crudos (debugging)"):
-    t1, t2 = st.tabs(["CMg Online", "CMg Programado PID"])
-    with t1:
-        if not df_real.empty:
-            st.write(f"**{len(df_real):,} registros** | columnas: {list(df_real.columns)}")
-            st.dataframe(df_real[df_real["barra_online"] == barra_online].head(100),
-                         use_container_width=True)
-    with t2:
-        if not df_prog.empty:
-            st.write(f"**{len(df_prog):,} registros** | columnas: {list(df_prog.columns)}")
-            st.dataframe(df_prog[df_prog["barra_prog"] == barra_prog].head(100),
-                         use_container_width=True)
+        df_merged = preparar_comparacion(real_dict, prog_dict, barra_online)
+
+        if df_merged.empty:
+            st.warning("No hay horas comunes entre el CMg Online y el Programado para esta barra.")
+        else:
+            # KPIs
+            k1, k2, k3, k4 = st.columns(4)
+            d          = df_merged["diferencia"].to_numpy()
+            d_abs      = np.abs(d)    # se reutiliza para MAE y máximo
+            diff_media = d.mean()
+            mae        = d_abs.mean()
+            max_diff   = d_abs.max()
+            pct_mayor  = (d > 0).mean() * 100
+
+            k1.metric("Diferencia media",     f"{diff_media:+.1f} USD/MWh",
+                      help="Promedio de (Real − Programado)")
+            k2.metric("MAE",                   f"{mae:.1f} USD/MWh",
+                      help="Error absoluto medio por hora")
+            k3.metric("Máx. desviación abs.", f"{max_diff:.1f} USD/MWh")
+            k4.metric("% horas Real > Prog.", f"{pct_mayor:.1f}%")
+
+            # Gráfico serie temporal + diferencia
+            fig = fig_comparacion(df_merged)
+            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+
+            # Histograma de diferencias
+            st.markdown("#### Distribución de diferencias (Real − Programado)")
+            fig_h = fig_histograma(df_merged)
+            st.plotly_chart(fig_h, use_container_width=True, config=PLOTLY_CONFIG)
+
+            # Tabla de datos
+            with st.expander("📋 Ver tabla de datos"):
+                st.dataframe(
+                    df_merged.rename(columns={
+                        "datetime":       "Fecha/Hora",
+                        "cmg_real":       "CMg Real (USD/MWh)",
+                        "cmg_programado": "CMg Prog. (USD/MWh)",
+                        "diferencia":     "Diferencia (USD/MWh)",
+                        "diferencia_pct": "Diferencia (%)",
+                    }).round(3),
+                    use_container_width=True,
+                )
+
+    # ── Sección 3: CMg Online en 15 min ──────────────────────────────────────
+    st.markdown("---")
+    st.subheader("🕐 CMg Online en resolución original (15 min)")
+
+    if tiene_real:
+        df_15 = df_real_b.dropna(subset=["cmg_real"]).sort_values("datetime")
+        n_15 = len(df_15)
+        if n_15 > PUNTOS_MAX_15MIN:
+            x_ns = df_15["datetime"].to_numpy().view("i8")
+            df_15 = df_15.iloc[lttb_indices(x_ns, df_15["cmg_real"].to_numpy(), PUNTOS_MAX_15MIN)]
+            st.caption(f"Mostrando {len(df_15):,} de {n_15:,} puntos (downsampling LTTB).")
+        fig_15 = fig_online_15min(df_15)
+        st.plotly_chart(fig_15, use_container_width=True, config=PLOTLY_CONFIG)
+    else:
+        st.info("Sin datos Online para esta barra en el período seleccionado.")
+
+    # ── Raw data ──────────────────────────────────────────────────────────────
+    with st.expander("🔬 Datos crudos (debugging)"):
+        t1, t2 = st.tabs(["CMg Online", "CMg Programado PID"])
+        with t1:
+            if real_dict:
+                n_real = sum(len(g) for g in real_dict.values())
+                st.write(f"**{n_real:,} registros** | columnas: {list(df_real_b.columns)}")
+                st.dataframe(df_real_b.head(100), use_container_width=True)
+        with t2:
+            if prog_dict:
+                n_prog = sum(len(g) for g in prog_dict.values())
+                st.write(f"**{n_prog:,} registros** | columnas: {list(df_prog_b.columns)}")
+                st.dataframe(df_prog_b.head(100), use_container_width=True)
+
+
+render_barra_section(real_dict, prog_dict)
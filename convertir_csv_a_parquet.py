@@ -0,0 +1,45 @@
+"""
+convertir_csv_a_parquet.py — Migración única de los datos a Parquet
+===================================================================
+Convierte los archivos generados por versiones anteriores de fetch_data.py
+(data/cmg_*.csv o data/cmg_*.parquet de un solo archivo) al dataset Parquet
+particionado por día (data/cmg_*/date=YYYY-MM-DD/) que usan ahora el
+recolector y el dashboard.
+
+Para correr (una sola vez):
+    python convertir_csv_a_parquet.py
+"""
+
+import os
+import pandas as pd
+
+from fetch_data import DATA_DIR, guardar_parquet
+
+ARCHIVOS = ["cmg_online", "cmg_programado"]
+
+LECTORES = {
+    # Lector CSV de Arrow (multihilo); los tipos quedan como numpy para que
+    # el dataset sea igual al que escribe fetch_data.py
+    ".csv":     lambda ruta: pd.read_csv(ruta, parse_dates=["datetime"], engine="pyarrow"),
+    ".parquet": lambda ruta: pd.read_parquet(ruta, engine="pyarrow"),
+}
+
+
+def main():
+    for nombre in ARCHIVOS:
+        for extension, leer in LECTORES.items():
+            ruta_origen = os.path.join(DATA_DIR, f"{nombre}{extension}")
+            if not os.path.isfile(ruta_origen):
+                continue
+            df = leer(ruta_origen)
+            ruta_dataset = os.path.join(DATA_DIR, nombre)
+            guardar_parquet(df, ruta_dataset)
+            os.remove(ruta_origen)
+            print(f"  ✓ {ruta_origen} → {ruta_dataset}/ ({len(df):,} registros)")
+            break
+        else:
+            print(f"  - Sin datos antiguos para {nombre}, se omite")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,25 @@ Este script se puede correr:
   - Manualmente:          python fetch_data.py
   - Programado (GitHub Actions): automáticamente cada hora
 
-Guarda los datos en la carpeta data/ como archivos CSV.
+Guarda los datos en la carpeta data/ como archivos Parquet.
 El dashboard (cmg_dashboard.py) lee desde esos archivos.
 """
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import json
+import math
 import os
+import shutil
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # =============================================================================
@@ -20,7 +31,7 @@ from datetime import datetime, timedelta
 # =============================================================================
 
 BASE_URL  = "https://sipub.api.coordinador.cl:443"
-DATA_DIR  = "data"   # carpeta donde se guardan los CSVs
+DATA_DIR  = "data"   # carpeta donde se guardan los Parquet
 
 # El token se lee desde variable de entorno (configurada en GitHub Actions Secrets)
 USER_KEY = os.environ.get("CEN_TOKEN", "")
@@ -28,6 +39,13 @@ USER_KEY = os.environ.get("CEN_TOKEN", "")
 # Cuántos días hacia atrás guardar (ajustable)
 DIAS_HISTORICO = 7
 
+# Estado de la descarga incremental: último timestamp recibido por endpoint
+ESTADO_PATH = os.path.join(DATA_DIR, "state.json")
+
+# Caché en disco de las respuestas de la API (sobrevive reinicios del proceso)
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+CACHE_TTL = 3600  # segundos
+
 # Diccionario de barras: clave = barra_transf (Online)
 #                         valor = llave_cmg (Programado)
 BARRAS = {
@@ -41,75 +59,185 @@ BARRAS = {
     "CHARRUA_______220": "Charrua220",
 }
 
+# Máximo de requests simultáneos contra la API (barras y páginas en
+# paralelo), para no gatillar los límites de tasa del CEN
+MAX_CONCURRENCIA = 4
+_LIMITE_CONCURRENCIA = threading.BoundedSemaphore(MAX_CONCURRENCIA)
+
+# Sesión HTTP compartida: reutiliza la conexión TLS entre páginas y barras
+# (keep-alive) y delega los reintentos con backoff en urllib3. Los 429 se
+# reintentan respetando el Retry-After que envíe la API.
+SESSION = requests.Session()
+SESSION.headers.update({"accept": "application/json"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# Tipos compactos para los DataFrames descargados y persistidos: float32
+# alcanza para USD/MWh y las columnas de barra (pocos valores distintos)
+# van como category
+TIPOS_COMPACTOS = {
+    "barra_online":   "category",
+    "barra_prog":     "category",
+    "nombre_barra":   "category",
+    "cmg_real":       "float32",
+    "cmg_real_clp":   "float32",
+    "cmg_programado": "float32",
+}
+
+
+def compactar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """Aplica TIPOS_COMPACTOS a las columnas presentes en df."""
+    return df.astype({c: t for c, t in TIPOS_COMPACTOS.items() if c in df.columns})
+
+
 # =============================================================================
 # FUNCIONES API
 # =============================================================================
 
-def fetch_paginated(url: str, params: dict, page_size: int = 500) -> list:
-    """Trae todos los registros de un endpoint con paginación y reintentos."""
-    all_records = []
-    page = 1
-    BACKOFF = [10, 30, 60]
-
+def _fetch_page(url: str, params: dict, page: int, page_size: int) -> dict | None:
+    """Trae una página; devuelve el JSON o None si falló (el error se reporta aquí)."""
+    params_page = {**params, "user_key": USER_KEY, "page": page, "limit": page_size}
+    try:
+        with _LIMITE_CONCURRENCIA:
+            r = SESSION.get(url, params=params_page, timeout=30)
+        r.raise_for_status()
+    except requests.exceptions.RetryError:
+        print("  ✗ Se agotaron los reintentos.")
+        return None
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else 0
+        print(f"  ⚠ Error {status} (página {page})")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"  ✗ Error de conexión: {e}")
+        return None
+    return orjson.loads(r.content)
+
+
+def _total_paginas(payload: dict, page_size: int) -> int | None:
+    """Número total de páginas si la respuesta lo informa, si no None."""
+    for clave in ("totalPages", "total_pages"):
+        if payload.get(clave) is not None:
+            return int(payload[clave])
+    for clave in ("total", "totalRecords", "total_records"):
+        if payload.get(clave) is not None:
+            return math.ceil(int(payload[clave]) / page_size)
+    return None
+
+
+def _a_tabla(tablas: list) -> pa.Table:
+    """Concatena las tablas Arrow de cada página (tolera columnas nulas en alguna)."""
+    if not tablas:
+        return pa.table({})
+    return pa.concat_tables(tablas, promote_options="permissive")
+
+
+def fetch_paginated(url: str, params: dict, page_size: int = 500) -> pa.Table:
+    """
+    Trae todos los registros de un endpoint con paginación (reintentos vía SESSION).
+    Si la primera página informa el total, las restantes se piden en paralelo;
+    si no, se recorren en secuencia hasta una página incompleta.
+    Cada página se convierte a una tabla Arrow columnar al llegar.
+    """
+    payload = _fetch_page(url, params, 1, page_size)
+    if payload is None:
+        return _a_tabla([])
+    records = payload.get("data", [])
+    tablas = [pa.Table.from_pylist(records)] if records else []
+    if len(records) < page_size:
+        return _a_tabla(tablas)
+
+    n_paginas = _total_paginas(payload, page_size)
+    if n_paginas is not None:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCIA) as ex:
+            paginas = ex.map(lambda p: _fetch_page(url, params, p, page_size),
+                             range(2, n_paginas + 1))
+            for payload in paginas:
+                if payload is None or not payload.get("data"):
+                    break
+                tablas.append(pa.Table.from_pylist(payload["data"]))
+        return _a_tabla(tablas)
+
+    page = 2
     while True:
-        params_page = {**params, "user_key": USER_KEY, "page": page, "limit": page_size}
-
-        for intento, espera in enumerate([0] + BACKOFF):
-            if espera:
-                print(f"  → Reintentando en {espera}s...")
-                time.sleep(espera)
-            try:
-                r = requests.get(url, params=params_page,
-                                 headers={"accept": "application/json"}, timeout=30)
-                r.raise_for_status()
-                break
-            except requests.exceptions.HTTPError as e:
-                status = e.response.status_code if e.response is not None else 0
-                print(f"  ⚠ Error {status} (intento {intento+1})")
-                if intento == len(BACKOFF):
-                    print("  ✗ Se agotaron los reintentos.")
-                    return all_records
-            except requests.exceptions.RequestException as e:
-                print(f"  ✗ Error de conexión: {e}")
-                return all_records
-
-        records = r.json().get("data", [])
+        time.sleep(1)
+        payload = _fetch_page(url, params, page, page_size)
+        if payload is None:
+            break
+        records = payload.get("data", [])
         if not records:
             break
-        all_records.extend(records)
+        tablas.append(pa.Table.from_pylist(records))
         if len(records) < page_size:
             break
         page += 1
-        time.sleep(1)
 
-    return all_records
+    return _a_tabla(tablas)
+
+
+def _cached_parquet(path: str, ttl: int, builder) -> pd.DataFrame:
+    """
+    Devuelve el DataFrame guardado en path si tiene menos de ttl segundos;
+    si no, lo construye con builder() y lo guarda. Los resultados vacíos no
+    se guardan, para reintentar la descarga en la próxima corrida.
+    """
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        print(f"  ↺ Usando caché {path}")
+        return pd.read_parquet(path, engine="pyarrow")
+    df = builder()
+    if not df.empty:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path, index=False, engine="pyarrow")
+    return df
+
+
+NS_POR_HORA   = 3_600_000_000_000
+NS_POR_MINUTO = 60_000_000_000
+
+
+def _assemble_datetime(df: pd.DataFrame) -> pd.Series:
+    """fecha + hra horas + min minutos, sumados como int64 (ns) en una sola expresión."""
+    base = pd.to_datetime(df["fecha"]).to_numpy().astype("datetime64[ns]").view("i8")
+    ns = (
+        base
+        + df["hra"].to_numpy().astype("i8") * NS_POR_HORA
+        + df["min"].to_numpy().astype("i8") * NS_POR_MINUTO
+    )
+    return pd.Series(ns.view("datetime64[ns]"), index=df.index)
 
 
 def fetch_online(start_date: str, end_date: str) -> pd.DataFrame:
+    """CMg Online del rango, desde la caché en disco si está vigente."""
+    path = os.path.join(CACHE_DIR, f"online_{start_date}_{end_date}.parquet")
+    return _cached_parquet(path, CACHE_TTL, lambda: _fetch_online(start_date, end_date))
+
+
+def _fetch_online(start_date: str, end_date: str) -> pd.DataFrame:
     """Trae CMg Online barra por barra usando barra_transf como filtro."""
     url = f"{BASE_URL}/costo-marginal-online/v4/findByDate"
-    dfs = []
 
-    for barra_transf in BARRAS:
+    def fetch_barra(barra_transf: str) -> pa.Table:
         print(f"  Barra Online: {barra_transf}")
-        records = fetch_paginated(url, {
+        return fetch_paginated(url, {
             "startDate":  start_date,
             "endDate":    end_date,
             "bar_transf": barra_transf,
         })
-        if records:
-            dfs.append(pd.DataFrame(records))
-        time.sleep(1)
 
-    if not dfs:
+    # Las barras se piden en paralelo; _LIMITE_CONCURRENCIA acota los
+    # requests en vuelo contra la API (barras y páginas en conjunto)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCIA) as ex:
+        tablas = [tabla for tabla in ex.map(fetch_barra, BARRAS) if tabla.num_rows]
+
+    if not tablas:
         return pd.DataFrame()
 
-    df = pd.concat(dfs, ignore_index=True)
-    df["datetime"] = (
-        pd.to_datetime(df["fecha"])
-        + pd.to_timedelta(df["hra"].astype(int), unit="h")
-        + pd.to_timedelta(df["min"].astype(int), unit="m")
-    )
+    # Una sola concatenación (en Arrow) y una sola conversión a pandas
+    df = _a_tabla(tablas).to_pandas()
+    df["datetime"] = _assemble_datetime(df)
     df = df.rename(columns={
         "barra_info":   "nombre_barra",
         "barra_transf": "barra_online",
@@ -117,18 +245,25 @@ def fetch_online(start_date: str, end_date: str) -> pd.DataFrame:
         "cmg_clp_kwh_": "cmg_real_clp",
     })
     cols = ["datetime", "barra_online", "nombre_barra", "cmg_real", "cmg_real_clp"]
-    return df[[c for c in cols if c in df.columns]].sort_values(["barra_online", "datetime"]).reset_index(drop=True)
+    df = df[[c for c in cols if c in df.columns]].sort_values(["barra_online", "datetime"]).reset_index(drop=True)
+    return compactar_tipos(df)
 
 
 def fetch_programado(start_date: str, end_date: str) -> pd.DataFrame:
+    """CMg Programado del rango, desde la caché en disco si está vigente."""
+    path = os.path.join(CACHE_DIR, f"programado_{start_date}_{end_date}.parquet")
+    return _cached_parquet(path, CACHE_TTL, lambda: _fetch_programado(start_date, end_date))
+
+
+def _fetch_programado(start_date: str, end_date: str) -> pd.DataFrame:
     """Trae CMg Programado PID."""
     url = f"{BASE_URL}/cmg-programado-pid/v4/findByDate"
-    records = fetch_paginated(url, {"startDate": start_date, "endDate": end_date})
+    tabla = fetch_paginated(url, {"startDate": start_date, "endDate": end_date})
 
-    if not records:
+    if not tabla.num_rows:
         return pd.DataFrame()
 
-    df = pd.DataFrame(records)
+    df = tabla.to_pandas()
     df["datetime"] = pd.to_datetime(df["fecha_hora"])
     df = df.rename(columns={
         "nmb_barra_info": "nombre_barra",
@@ -140,22 +275,44 @@ def fetch_programado(start_date: str, end_date: str) -> pd.DataFrame:
     df = df[df["barra_prog"].isin(barras_prog)]
 
     cols = ["datetime", "barra_prog", "nombre_barra", "cmg_programado", "zona", "region"]
-    return df[[c for c in cols if c in df.columns]].sort_values(["barra_prog", "datetime"]).reset_index(drop=True)
+    df = df[[c for c in cols if c in df.columns]].sort_values(["barra_prog", "datetime"]).reset_index(drop=True)
+    return compactar_tipos(df)
 
 
 # =============================================================================
 # LÓGICA PRINCIPAL
 # =============================================================================
 
-def actualizar_csv(nombre_archivo: str, df_nuevo: pd.DataFrame, col_datetime: str = "datetime"):
+def guardar_parquet(df: pd.DataFrame, ruta: str):
+    """
+    Guarda un DataFrame como dataset Parquet particionado por día
+    (ruta/date=YYYY-MM-DD/part-0.parquet), comprimido con zstd y con los
+    tipos de TIPOS_COMPACTOS. El particionado permite al dashboard leer
+    solo los días del rango seleccionado.
+    """
+    df = compactar_tipos(df)
+
+    # La columna de partición se deriva en Arrow (timestamp → date32),
+    # sin formatear cada fila como string en Python
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.append_column("date", pc.cast(tabla["datetime"], pa.date32()))
+
+    # Se reescribe el dataset completo para que desaparezcan los días recortados
+    if os.path.isdir(ruta):
+        shutil.rmtree(ruta)
+    pq.write_to_dataset(tabla, ruta, partition_cols=["date"],
+                        basename_template="part-{i}.parquet", compression="zstd")
+
+
+def actualizar_parquet(nombre_dataset: str, df_nuevo: pd.DataFrame, col_datetime: str = "datetime"):
     """
-    Combina el CSV existente con los datos nuevos y guarda.
+    Combina el dataset Parquet existente con los datos nuevos y guarda.
     Elimina duplicados manteniendo el registro más reciente.
     """
-    ruta = os.path.join(DATA_DIR, nombre_archivo)
+    ruta = os.path.join(DATA_DIR, nombre_dataset)
 
-    if os.path.exists(ruta):
-        df_existente = pd.read_csv(ruta, parse_dates=[col_datetime])
+    if os.path.isdir(ruta):
+        df_existente = pd.read_parquet(ruta, engine="pyarrow").drop(columns="date")
         df_combinado = pd.concat([df_existente, df_nuevo], ignore_index=True)
     else:
         df_combinado = df_nuevo.copy()
@@ -167,21 +324,53 @@ def actualizar_csv(nombre_archivo: str, df_nuevo: pd.DataFrame, col_datetime: st
     elif "barra_prog" in df_combinado.columns:
         subset_dedup.append("barra_prog")
 
+    # Un solo groupby ordenado deduplica y ordena a la vez; last() se queda
+    # con el último valor no nulo de cada columna (los datos nuevos priman)
     df_combinado = (
         df_combinado
-        .drop_duplicates(subset=subset_dedup, keep="last")
-        .sort_values(subset_dedup)
-        .reset_index(drop=True)
+        .groupby(subset_dedup, as_index=False, sort=True, observed=True)
+        .last()
     )
 
     # Recortar al histórico definido para no crecer indefinidamente
     corte = pd.Timestamp.now() - pd.Timedelta(days=DIAS_HISTORICO)
     df_combinado = df_combinado[df_combinado[col_datetime] >= corte]
 
-    df_combinado.to_csv(ruta, index=False)
+    guardar_parquet(df_combinado, ruta)
     print(f"  ✓ {ruta} — {len(df_combinado):,} registros guardados")
 
 
+def leer_estado() -> dict:
+    """Lee data/state.json ({"online_last": ..., "prog_last": ...}) si existe."""
+    if not os.path.exists(ESTADO_PATH):
+        return {}
+    with open(ESTADO_PATH) as f:
+        return json.load(f)
+
+
+def guardar_estado(estado: dict):
+    """Guarda el estado incremental en data/state.json."""
+    with open(ESTADO_PATH, "w") as f:
+        json.dump(estado, f, indent=2)
+
+
+def descargar_online(fechas: list[str]) -> pd.DataFrame:
+    """
+    CMg Online: probamos las fechas en orden (hoy y ayer en UTC) ya que el
+    endpoint solo entrega datos recientes. Nos quedamos con la primera
+    fecha que tenga datos.
+    """
+    for fecha_str in fechas:
+        print(f"\n📡 Descargando CMg Online ({fecha_str})...")
+        df_online = fetch_online(fecha_str, fecha_str)
+        if not df_online.empty:
+            print(f"  ✓ Datos encontrados para {fecha_str}")
+            return df_online
+        print(f"  ✗ Sin datos para {fecha_str}, probando fecha anterior...")
+    print("  ✗ Sin datos Online para ninguna fecha")
+    return pd.DataFrame()
+
+
 def main():
     if not USER_KEY:
         raise ValueError("No se encontró CEN_TOKEN. Configúralo como variable de entorno.")
@@ -191,33 +380,41 @@ def main():
     hoy   = datetime.today().date()
     ayer  = hoy - timedelta(days=1)  # usamos ayer como fin para evitar el
     hace  = hoy - timedelta(days=3)  # desfase UTC vs hora Chile
-    start_str = hace.strftime("%Y-%m-%d")
+
+    # Programado incremental: desde el último dato recibido (con 1 h de
+    # solape para registros tardíos; actualizar_parquet deduplica), sin
+    # retroceder más de 3 días
+    estado = leer_estado()
+    inicio = hace
+    if "prog_last" in estado:
+        desde  = (pd.Timestamp(estado["prog_last"]) - pd.Timedelta(hours=1)).date()
+        inicio = min(max(desde, hace), ayer)
+    start_str = inicio.strftime("%Y-%m-%d")
     end_str   = ayer.strftime("%Y-%m-%d")
 
     print(f"\n{'='*50}")
     print(f"Actualizando datos: {start_str} → {end_str}")
     print(f"{'='*50}")
 
-    # CMg Online: probamos hoy y ayer en UTC ya que el endpoint solo
-    # entrega datos recientes. Nos quedamos con la fecha que tenga datos.
+    # CMg Online y Programado son endpoints independientes: se descargan
+    # en paralelo y la corrida dura lo que el más lento, no la suma
     hoy_str  = hoy.strftime("%Y-%m-%d")
     ayer_str = ayer.strftime("%Y-%m-%d")
-    df_online = pd.DataFrame()
-    for fecha_str in [hoy_str, ayer_str]:
-        print(f"\n📡 Descargando CMg Online ({fecha_str})...")
-        df_online = fetch_online(fecha_str, fecha_str)
-        if not df_online.empty:
-            print(f"  ✓ Datos encontrados para {fecha_str}")
-            actualizar_csv("cmg_online.csv", df_online)
-            break
-        print(f"  ✗ Sin datos para {fecha_str}, probando fecha anterior...")
-    else:
-        print("  ✗ Sin datos Online para ninguna fecha")
-    df_prog = fetch_programado(start_str, end_str)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fut_online = ex.submit(descargar_online, [hoy_str, ayer_str])
+        fut_prog   = ex.submit(fetch_programado, start_str, end_str)
+        df_online  = fut_online.result()
+        df_prog    = fut_prog.result()
+
+    if not df_online.empty:
+        actualizar_parquet("cmg_online", df_online)
+        estado["online_last"] = df_online["datetime"].max().isoformat()
     if not df_prog.empty:
-        actualizar_csv("cmg_programado.csv", df_prog)
+        actualizar_parquet("cmg_programado", df_prog)
+        estado["prog_last"] = df_prog["datetime"].max().isoformat()
     else:
         print("  ✗ Sin datos Programado")
+    guardar_estado(estado)
 
     # Guardar timestamp de última actualización
     with open(os.path.join(DATA_DIR, "ultima_actualizacion.txt"), "w") as f: